@@ -20,6 +20,7 @@ os.environ["CURL_CA_BUNDLE"] = ""
 
 # Import routes
 from routes.analysis import analysis_bp
+from utils.json_provider import install_json_provider
 
 # Import models for initialization
 from config.firebase_config import db
@@ -33,11 +34,29 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Ship audit events to Cloud Logging when they are not stored in Firestore
+if os.environ.get('AUDIT_LOG_SINK', 'firestore').lower() == 'logging':
+    try:
+        import google.cloud.logging
+        from google.cloud.logging.handlers import CloudLoggingHandler
+        
+        logging.getLogger('audit').addHandler(
+            CloudLoggingHandler(google.cloud.logging.Client(), name='tracelens-audit')
+        )
+    except Exception as e:
+        # stdout is still collected by the platform's log agent
+        logger.warning(f"Cloud Logging handler unavailable, audit events go to stdout: {str(e)}")
+
 # Create Flask app
 app = Flask(__name__)
 
+# orjson encodes responses, including datetimes, much faster than the stdlib encoder
+install_json_provider(app)
+
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-change-in-production')
+# Request bodies are small JSON documents; anything larger is refused before parsing
+app.config['MAX_CONTENT_LENGTH'] = 8 * 1024
 
 # ✅ COMPREHENSIVE CORS CONFIGURATION FOR FRONTEND-BACKEND COMMUNICATION
 CORS(app, 
@@ -67,7 +86,13 @@ limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["200 per hour", "50 per minute"],
-    storage_uri="memory://",
+    # Point this at Redis in production so limits, including the per-user daily
+    # analysis quota in routes.analysis, are shared and atomic across workers.
+    # With the default memory:// every process keeps its own counters and they
+    # reset on restart, so the quota is only enforced per process. Its 24h window
+    # starts at a user's first analysis rather than at the reset of the Firestore
+    # daily_usage counter, which /start checks as well; the stricter of the two wins.
+    storage_uri=os.environ.get('RATELIMIT_STORAGE_URI', 'memory://'),
 )
 
 # Register blueprints
@@ -224,8 +249,11 @@ def setup_cleanup_scheduler():
     cleanup_thread.start()
     logger.info("Background cleanup scheduler started")
 
-# Initialize background tasks
-setup_cleanup_scheduler()
+# Initialize background tasks. Once the Firestore TTL policy on
+# analysis_sessions.expires_at is deployed, Firestore deletes expired sessions
+# itself and the Python sweep can be switched off.
+if os.environ.get('FIRESTORE_TTL_POLICY_ENABLED', 'false').lower() != 'true':
+    setup_cleanup_scheduler()
 
 if __name__ == '__main__':
     # Development server
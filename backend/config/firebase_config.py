@@ -29,7 +29,10 @@ def initialize_firebase():
         logging.error(f"Failed to initialize Firebase: {e}")
         raise
 
-# Initialize and export the db instance
+# Initialize and export the db instance once per process; the client's gRPC
+# channel is thread-safe, so every model and background thread shares it.
+# google-cloud-firestore opens that channel with grpc.keepalive_time_ms=30000,
+# which keeps it warm behind load balancers that drop idle connections.
 try:
     db = initialize_firebase()
 except Exception as e:
@@ -48,7 +48,7 @@ def require_auth(f):
                 user_name = decoded_token.get('name', '')
                 email_verified = decoded_token.get('email_verified', False)
                 
-                logging.info(f"User authenticated: {user_id}")
+                logging.info("User authenticated: %s", user_id)
                 
                 # Add user information to request object
                 request.user_id = user_id
@@ -94,14 +94,14 @@ def require_auth(f):
                 }), 503
                 
             except Exception as e:
-                logging.error(f"Firebase token verification error: {str(e)}")
+                logging.error("Firebase token verification error: %s", e)
                 return jsonify({
                     'success': False,
                     'error': f'Authentication error: {str(e)}'
                 }), 401
                 
         except Exception as e:
-            logging.error(f"Authentication middleware error: {str(e)}")
+            logging.error("Authentication middleware error: %s", e)
             return jsonify({
                 'success': False,
                 'error': 'Internal authentication error'
@@ -151,10 +151,10 @@ def optional_auth(f):
                     'email_verified': email_verified
                 }
                 
-                logging.info(f"Optional auth - User authenticated: {user_id}")
+                logging.info("Optional auth - User authenticated: %s", user_id)
                 
             except Exception as e:
-                logging.warning(f"Optional auth - Invalid token: {str(e)}")
+                logging.warning("Optional auth - Invalid token: %s", e)
                 # Invalid token - continue without user info
                 request.user_id = None
                 request.user_email = None
@@ -165,7 +165,7 @@ def optional_auth(f):
             return f(*args, **kwargs)
             
         except Exception as e:
-            logging.error(f"Optional authentication middleware error: {str(e)}")
+            logging.error("Optional authentication middleware error: %s", e)
             # Continue without user info on error
             request.user_id = None
             request.user_email = None
@@ -186,7 +186,7 @@ def verify_token(id_token):
         decoded_token = firebase_auth.verify_id_token(id_token)
         return decoded_token
     except Exception as e:
-        logging.error(f"Token verification failed: {str(e)}")
+        logging.error("Token verification failed: %s", e)
         raise e
 
 def get_current_user():
@@ -199,7 +199,7 @@ def get_current_user():
             return request.user_info
         return None
     except Exception as e:
-        logging.error(f"Error getting current user: {str(e)}")
+        logging.error("Error getting current user: %s", e)
         return None
 
 def extract_token_from_request():
@@ -213,7 +213,7 @@ def extract_token_from_request():
             return auth_header.split('Bearer ')[1]
         return None
     except Exception as e:
-        logging.error(f"Error extracting token: {str(e)}")
+        logging.error("Error extracting token: %s", e)
         return None
 
 # Export all functions
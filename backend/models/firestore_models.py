@@ -1,9 +1,201 @@
+import atexit
+import copy
+import functools
+import inspect
+import json
 import logging
+import os
+import queue
+import threading
+import time
 from datetime import datetime, timedelta, timezone
+from google.api_core import retry
+from google.api_core.exceptions import Aborted, DeadlineExceeded, ServiceUnavailable
 from google.cloud import firestore
 from config.firebase_config import db
-import uuid
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TLRUCache, TTLCache
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+
+# Expired sessions are read for cleanup this many at a time
+CLEANUP_PAGE_SIZE = 500
+
+# Audit logs are buffered and written by a single background writer
+AUDIT_QUEUE_SIZE = 10000
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 0.1
+AUDIT_WRITE_WORKERS = 10
+
+# Detail fields promoted to top-level audit fields, and the longest user agent kept
+AUDIT_HOISTED_FIELDS = frozenset(('user_agent', 'session_id'))
+AUDIT_USER_AGENT_MAX_LENGTH = 256
+
+# 'firestore' keeps audit_logs documents; 'logging' emits each event as JSON on the
+# 'audit' logger instead, for a Cloud Logging sink exported to BigQuery
+AUDIT_LOG_SINK = os.environ.get('AUDIT_LOG_SINK', 'firestore').lower()
+audit_logger = logging.getLogger('audit')
+
+# User profiles change rarely; cache reads per process and invalidate on our own writes
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60
+
+# Session documents are polled constantly while an analysis runs; a short cache absorbs
+# repeat reads and our own writes invalidate it
+SESSION_CACHE_SIZE = 10000
+SESSION_CACHE_TTL = 2.0
+# Completed and failed sessions no longer change until deleted, so they are kept a little
+# longer; still short, since deletes by other processes or the TTL policy aren't seen here
+TERMINAL_SESSION_CACHE_TTL = 30
+# Expired and missing sessions never come back (ids are never reused), so ids seen
+# in either state are remembered much longer and answered without a read
+GONE_SESSION_CACHE_TTL = 600
+
+# Results larger than this are moved out of the session document into a
+# session_results subdocument so progress writes and status reads stay small
+RESULTS_INLINE_LIMIT = 200_000
+# The subdocument is still a single Firestore document capped at 1 MiB; results over
+# this (leaving headroom for field names and expires_at) are refused with a clear error
+RESULTS_MAX_SIZE = 1_000_000
+RESULTS_COLLECTION = 'session_results'
+RESULTS_DOCUMENT = 'full'
+
+# Progress updates for a session are coalesced and written at most this often,
+# keeping each session document under Firestore's sustained ~1 write/sec guidance
+PROGRESS_FLUSH_INTERVAL = 0.5
+
+# Fields the history list shows; skips the bulk of results and processing_steps
+SESSION_SUMMARY_FIELDS = [
+    'url',
+    'analysis_type',
+    'status',
+    'progress',
+    'created_at',
+    'completed_at',
+    'error_message',
+    'results.analysis_metadata'
+]
+
+# Fields behind the status endpoints: ownership, expiry and everything the status payload shows
+SESSION_STATUS_FIELDS = [
+    'user_id',
+    'url',
+    'analysis_type',
+    'status',
+    'progress',
+    'created_at',
+    'updated_at',
+    'completed_at',
+    'failed_at',
+    'expires_at',
+    'error_message',
+    'processing_steps',
+    'results.analysis_metadata'
+]
+
+# Fields behind the results endpoint; skips metadata and privacy settings it never shows
+SESSION_RESULTS_FIELDS = [
+    'user_id',
+    'url',
+    'analysis_type',
+    'status',
+    'completed_at',
+    'expires_at',
+    'processing_steps',
+    'results',
+    'results_external'
+]
+
+# Field mask behind each session read; the view name also keys the session cache
+SESSION_VIEWS = {
+    'status': SESSION_STATUS_FIELDS,
+    'results': SESSION_RESULTS_FIELDS
+}
+
+# Constant nested fields written with every new user and session. They are shared
+# between documents rather than rebuilt per call, so never mutate them in place.
+_USER_PREFERENCES = {
+    'email_notifications': True,
+    'data_retention_days': 1,
+    'analysis_history_visible': True
+}
+_USER_USAGE_LIMITS = {
+    'daily_limit': 3,
+    'hourly_limit': 1,
+    'monthly_limit': 50
+}
+_SESSION_METADATA = {
+    'analysis_version': '1.0.0',
+    'frameworks_used': (
+        'privacy_framework',
+        'ethical_framework',
+        'consent_framework',
+        'legal_framework'
+    )
+}
+_SESSION_PRIVACY_SETTINGS = {
+    'auto_delete': True,
+    'data_anonymized': True,
+    'consent_given': True,
+    'processing_purpose': 'digital_footprint_analysis'
+}
+
+# Audit actions that count as personal data processing for compliance flags
+DATA_PROCESSING_ACTIONS = frozenset(('analysis_start', 'data_collection', 'results_generated'))
+
+# Session statuses after which a session no longer changes
+TERMINAL_STATUSES = frozenset(('completed', 'failed'))
+
+# Bits of an audit log's compliance_flags
+COMPLIANCE_GDPR_RELEVANT = 1
+COMPLIANCE_DATA_PROCESSING = 2
+COMPLIANCE_USER_CONSENT = 4
+
+# Transient contention/availability errors are retried with jittered exponential
+# backoff on reads and writes; anything else (PermissionDenied, NotFound, ...)
+# fails immediately
+FIRESTORE_RETRY = retry.Retry(
+    predicate=retry.if_exception_type(Aborted, ServiceUnavailable, DeadlineExceeded),
+    initial=0.05,
+    maximum=1.0,
+    multiplier=2.0,
+    timeout=10.0
+)
+
+# Writes that already carry one of these don't need a separate updated_at
+TIMESTAMP_FIELDS = ('completed_at', 'failed_at')
+
+def firestore_op(description: str, **failure_defaults):
+    """Wrap a model method in the shared success/error result envelope.
+    
+    The method returns only its payload and the wrapper adds 'success': True.
+    Payloads that already carry 'success' (e.g. not-found results) pass through.
+    On an exception it logs "Error <description>: <e>", with the description
+    formatted from the call's arguments, and returns the error plus failure_defaults.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                arguments = signature.bind(*args, **kwargs)
+                arguments.apply_defaults()
+                logging.error("Error %s: %s", description.format(**arguments.arguments), e)
+                return {'success': False, 'error': str(e), **copy.deepcopy(failure_defaults)}
+            if 'success' in result:
+                return result
+            return {'success': True, **result}
+        return wrapper
+    return decorator
+
+def stamp_updated_at(update_data: Dict[str, Any], ignore_timestamp: bool = False) -> Dict[str, Any]:
+    """Add updated_at to an update unless it is ignored or already timestamped"""
+    if ignore_timestamp or any(field in update_data for field in TIMESTAMP_FIELDS):
+        return update_data
+    update_data['updated_at'] = datetime.now(timezone.utc)
+    return update_data
 
 def normalize_datetime(dt):
     """Helper function to normalize datetime objects for comparison"""
@@ -16,357 +208,690 @@ def normalize_datetime(dt):
             return dt
     return dt
 
-class FirestoreUser:
+def is_expired(session_data: Dict[str, Any]) -> bool:
+    """Check a session's expires_at; the TTL policy may not have deleted the doc yet"""
+    # Firestore returns aware datetimes
+    expires_at = session_data.get('expires_at')
+    return bool(expires_at) and normalize_datetime(expires_at) < datetime.now(timezone.utc)
+
+class FirestoreModel:
+    """Base class caching the CollectionReference for a model's collection"""
+    
+    COLLECTION = None
+    _collection = None
+    _collection_db = None
+    
+    @classmethod
+    def _coll(cls):
+        """Return the cached collection, rebuilding it if the db client was swapped"""
+        if cls._collection is None or cls._collection_db is not db:
+            cls._collection = db.collection(cls.COLLECTION)
+            cls._collection_db = db
+        return cls._collection
+
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+
+class FirestoreUser(FirestoreModel):
     """User model for Firestore operations"""
     
-    @staticmethod
-    def create_user(user_id: str, email: str, display_name: str = None) -> Dict[str, Any]:
-        """Create a new user in Firestore"""
-        try:
-            user_data = {
-                'user_id': user_id,
-                'email': email,
-                'display_name': display_name,
-                'subscription_tier': 'free',
-                'daily_usage': 0,  # ✅ FIXED: Initialize with 0
-                'lifetime_analysis_count': 0,
-                'privacy_level': 'standard',
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'last_login': firestore.SERVER_TIMESTAMP,
-                'preferences': {
-                    'email_notifications': True,
-                    'data_retention_days': 1,
-                    'analysis_history_visible': True
-                },
-                'usage_limits': {
-                    'daily_limit': 3,
-                    'hourly_limit': 1,
-                    'monthly_limit': 50
-                },
-                'account_status': 'active',
-                'email_verified': False,
-                'terms_accepted': True,
-                'privacy_policy_accepted': True,
-                'last_usage_reset': firestore.SERVER_TIMESTAMP
-            }
-            
-            db.collection('users').document(user_id).set(user_data)
-            
-            logging.info(f"User created successfully: {user_id}")
-            return {'success': True, 'user_data': user_data}
-            
-        except Exception as e:
-            logging.error(f"Error creating user {user_id}: {e}")
-            return {'success': False, 'error': str(e)}
+    COLLECTION = 'users'
     
     @staticmethod
-    def get_user(user_id: str) -> Dict[str, Any]:
-        """Get user data from Firestore"""
-        try:
-            user_ref = db.collection('users').document(user_id)
-            user_doc = user_ref.get()
-            
-            if user_doc.exists:
-                user_data = user_doc.to_dict()
-                
-                # ✅ FIXED: Ensure daily_usage field exists
-                if 'daily_usage' not in user_data:
-                    user_data['daily_usage'] = 0
-                    # Update the document to include the missing field
-                    user_ref.update({'daily_usage': 0})
-                
-                logging.info(f"User retrieved successfully: {user_id}")
-                return {'success': True, 'user': user_data}
-            else:
-                logging.warning(f"User not found: {user_id}")
-                return {'success': False, 'error': 'User not found'}
-                
-        except Exception as e:
-            logging.error(f"Error getting user {user_id}: {e}")
-            return {'success': False, 'error': str(e)}
+    def invalidate_cache(user_id: str) -> None:
+        """Drop a user from the in-process profile cache"""
+        with _user_cache_lock:
+            _user_cache.pop(user_id, None)
     
     @staticmethod
-    def increment_usage(user_id: str) -> Dict[str, Any]:
-        """Increment user's daily usage count"""
-        try:
-            user_ref = db.collection('users').document(user_id)
-            
-            @firestore.transactional
-            def increment_counters(transaction, user_ref):
-                user_doc = user_ref.get(transaction=transaction)
-                if user_doc.exists:
-                    user_data = user_doc.to_dict()
-                    current_usage = user_data.get('daily_usage', 0)  # ✅ Default to 0 if missing
-                    lifetime_count = user_data.get('lifetime_analysis_count', 0)
-                    
-                    transaction.update(user_ref, {
-                        'daily_usage': current_usage + 1,
-                        'lifetime_analysis_count': lifetime_count + 1,
-                        'last_analysis': firestore.SERVER_TIMESTAMP
-                    })
-                    
-                    return current_usage + 1
-                else:
-                    raise Exception("User not found")
-            
-            transaction = db.transaction()
-            new_usage = increment_counters(transaction, user_ref)
-            
-            logging.info(f"Usage incremented for user {user_id}: {new_usage}")
-            return {'success': True, 'daily_usage': new_usage}
-            
-        except Exception as e:
-            logging.error(f"Error incrementing usage for {user_id}: {e}")
-            return {'success': False, 'error': str(e)}
+    def cache_profile(user_id: str, user_data: Dict[str, Any]) -> None:
+        """Seed the profile cache with a profile the caller has just committed"""
+        with _user_cache_lock:
+            _user_cache[user_id] = dict(user_data)
+    
+    @classmethod
+    @firestore_op('creating user {user_id}')
+    def create_user(cls, user_id: str, email: str, display_name: str = None, batch=None) -> Dict[str, Any]:
+        """Create a new user in Firestore.
+        
+        With a batch the write is staged for the caller, who can cache_profile the
+        returned user_data once the batch has committed.
+        """
+        now = datetime.now(timezone.utc)
+        user_data = {
+            'user_id': user_id,
+            'email': email,
+            'display_name': display_name,
+            'subscription_tier': 'free',
+            'daily_usage': 0,  # ✅ FIXED: Initialize with 0
+            'lifetime_analysis_count': 0,
+            'privacy_level': 'standard',
+            'created_at': firestore.SERVER_TIMESTAMP,  # Server time kept for the audit trail
+            'last_login': now,
+            'preferences': _USER_PREFERENCES,
+            'usage_limits': _USER_USAGE_LIMITS,
+            'account_status': 'active',
+            'email_verified': False,
+            'terms_accepted': True,
+            'privacy_policy_accepted': True,
+            'last_usage_reset': now
+        }
+        
+        user_ref = cls._coll().document(user_id)
+        if batch is not None:
+            batch.set(user_ref, user_data)
+        else:
+            user_ref.set(user_data, retry=FIRESTORE_RETRY)
+        
+        # The sentinel only means something to Firestore; callers and the cache get the client time
+        user_data = {**user_data, 'created_at': now}
+        if batch is None:
+            cls.cache_profile(user_id, user_data)
+        else:
+            cls.invalidate_cache(user_id)
+        
+        logging.info("User created successfully: %s", user_id)
+        return {'user_data': user_data}
+    
+    @classmethod
+    @firestore_op('getting user {user_id}')
+    def get_user(cls, user_id: str) -> Dict[str, Any]:
+        """Get user data from Firestore, served from the TTL cache when possible"""
+        with _user_cache_lock:
+            cached = _user_cache.get(user_id)
+        if cached is not None:
+            return {'user': dict(cached)}
+        
+        user_ref = cls._coll().document(user_id)
+        user_doc = user_ref.get(retry=FIRESTORE_RETRY)
+        
+        if user_doc.exists:
+            user_data = user_doc.to_dict()
+            
+            # ✅ FIXED: Ensure daily_usage field exists
+            if 'daily_usage' not in user_data:
+                user_data['daily_usage'] = 0
+                # Merge the missing field in; unlike update() this can't fail on a racing delete
+                user_ref.set({'daily_usage': 0}, merge=True, retry=FIRESTORE_RETRY)
+            
+            with _user_cache_lock:
+                _user_cache[user_id] = user_data
+            
+            logging.info("User retrieved successfully: %s", user_id)
+            return {'user': dict(user_data)}
+        else:
+            logging.warning("User not found: %s", user_id)
+            return {'success': False, 'error': 'User not found'}
+    
+    @classmethod
+    @firestore_op('incrementing usage for {user_id}')
+    def increment_usage(cls, user_id: str, current_usage: Optional[int] = None, batch=None) -> Dict[str, Any]:
+        """Increment user's daily usage count.
+        
+        Pass the daily_usage the caller already loaded as current_usage to get the
+        new count back without reading the document again. With a batch the write is
+        staged for the caller to commit.
+        """
+        # Server-side increments: one write, no read and no transaction contention.
+        # update() still fails with NotFound if the user document is missing.
+        # Not retried: a timed-out increment may have applied and must not count twice.
+        increments = {
+            'daily_usage': firestore.Increment(1),
+            'lifetime_analysis_count': firestore.Increment(1),
+            'last_analysis': firestore.SERVER_TIMESTAMP
+        }
+        user_ref = cls._coll().document(user_id)
+        if batch is not None:
+            batch.update(user_ref, increments)
+            update_time = datetime.now(timezone.utc)
+        else:
+            update_time = user_ref.update(increments).update_time
+        
+        # Apply the same increments to the cached profile so the next quota check stays a cache hit
+        with _user_cache_lock:
+            cached = _user_cache.get(user_id)
+            if cached is not None:
+                cached['daily_usage'] = cached.get('daily_usage', 0) + 1
+                cached['lifetime_analysis_count'] = cached.get('lifetime_analysis_count', 0) + 1
+                cached['last_analysis'] = update_time
+        
+        logging.info("Usage incremented for user %s", user_id)
+        result = {'update_time': update_time}
+        if current_usage is not None:
+            result['daily_usage'] = current_usage + 1
+        return result
 
-class AnalysisSession:
+class _ProgressCoalescer:
+    """Buffers progress updates per session and writes the latest snapshot in one update"""
+    
+    def __init__(self, window: float):
+        self.window = window
+        self._pending = {}
+        self._last_flush = {}
+        self._lock = threading.Lock()
+        # Held across a flush write so a terminal write can't be overtaken by it
+        self._flush_lock = threading.Lock()
+    
+    def add(self, session_id: str, progress: int, status: str, step: Optional[Dict[str, Any]]) -> None:
+        """Record the latest progress, arming a flush timer for the first update in a window.
+        
+        The first update after a quiet window is written right away; later ones wait
+        until a full window has passed since the previous write.
+        """
+        with self._lock:
+            entry = self._pending.get(session_id)
+            if entry is None:
+                last_flush = self._last_flush.get(session_id)
+                delay = 0 if last_flush is None else max(0.0, last_flush + self.window - time.monotonic())
+                timer = threading.Timer(delay, self.flush, args=(session_id,))
+                timer.daemon = True
+                entry = {'steps': [], 'timer': timer}
+                self._pending[session_id] = entry
+                timer.start()
+            entry['progress'] = progress
+            entry['status'] = status
+            if step:
+                entry['steps'].append(step)
+    
+    def _take(self, session_id: str) -> Dict[str, Any]:
+        """Remove a session's buffered updates and return them as update fields"""
+        with self._lock:
+            entry = self._pending.pop(session_id, None)
+        if entry is None:
+            return {}
+        entry['timer'].cancel()
+        update_data = {'progress': entry['progress'], 'status': entry['status']}
+        if entry['steps']:
+            # SERVER_TIMESTAMP isn't allowed inside arrays, so steps carry client timestamps
+            update_data['processing_steps'] = firestore.ArrayUnion(entry['steps'])
+        return update_data
+    
+    def drain(self, session_id: str) -> Dict[str, Any]:
+        """Take buffered updates for a terminal write, after any in-flight flush lands"""
+        with self._flush_lock:
+            with self._lock:
+                self._last_flush.pop(session_id, None)
+            return self._take(session_id)
+    
+    def flush(self, session_id: str) -> None:
+        """Write a session's buffered updates to Firestore"""
+        with self._flush_lock:
+            update_data = self._take(session_id)
+            if not update_data:
+                return
+            with self._lock:
+                self._last_flush[session_id] = time.monotonic()
+            try:
+                # The newest step's timestamp already records when this write happened
+                AnalysisSession._coll().document(session_id).update(
+                    stamp_updated_at(update_data, ignore_timestamp='processing_steps' in update_data),
+                    retry=FIRESTORE_RETRY
+                )
+                AnalysisSession.invalidate_cache(session_id)
+                logging.info("Progress flushed for session %s: %s%% - %s", session_id, update_data['progress'], update_data['status'])
+            except Exception as e:
+                logging.error("Error flushing progress for session %s: %s", session_id, e)
+
+_progress_coalescer = _ProgressCoalescer(PROGRESS_FLUSH_INTERVAL)
+
+def _session_cache_ttu(key, session_data, now):
+    """Expiry time for a cached session: short while it can still change, longer once terminal"""
+    if session_data.get('status') in TERMINAL_STATUSES:
+        return now + TERMINAL_SESSION_CACHE_TTL
+    return now + SESSION_CACHE_TTL
+
+_session_cache = TLRUCache(maxsize=SESSION_CACHE_SIZE, ttu=_session_cache_ttu)
+# session_id -> the error a read of it returns
+_gone_sessions = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=GONE_SESSION_CACHE_TTL)
+_session_cache_lock = threading.Lock()
+
+def _cached_session(session_id: str, view: str) -> Optional[Dict[str, Any]]:
+    """Answer a session read from the in-process caches, or None when Firestore must be asked"""
+    with _session_cache_lock:
+        gone_error = _gone_sessions.get(session_id)
+        if gone_error is not None:
+            return {'success': False, 'error': gone_error}
+        cached = _session_cache.get((session_id, view))
+    if cached is None:
+        return None
+    if is_expired(cached):
+        return _remember_gone(session_id, 'Session expired')
+    return {'session': dict(cached)}
+
+def _remember_gone(session_id: str, error: str) -> Dict[str, Any]:
+    """Record that a session is expired or missing so later reads skip Firestore; returns the failure"""
+    logging.warning("%s: %s", error, session_id)
+    with _session_cache_lock:
+        _gone_sessions[session_id] = error
+    return {'success': False, 'error': error}
+
+class AnalysisSession(FirestoreModel):
     """Analysis session model for Firestore operations"""
     
-    @staticmethod
-    def create_session(user_id: str, url: str, analysis_type: str) -> Dict[str, Any]:
-        """Create a new analysis session"""
-        try:
-            session_id = str(uuid.uuid4())
-            
-            session_data = {
-                'session_id': session_id,
-                'user_id': user_id,
-                'url': url,
-                'analysis_type': analysis_type,
-                'status': 'pending',
-                'progress': 0,
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'updated_at': firestore.SERVER_TIMESTAMP,
-                'expires_at': datetime.now(timezone.utc) + timedelta(hours=24),
-                'results': None,
-                'error_message': None,
-                'processing_steps': [],
-                'metadata': {
-                    'analysis_version': '1.0.0',
-                    'frameworks_used': [
-                        'privacy_framework',
-                        'ethical_framework',
-                        'consent_framework',
-                        'legal_framework'
-                    ]
-                },
-                'privacy_settings': {
-                    'auto_delete': True,
-                    'data_anonymized': True,
-                    'consent_given': True,
-                    'processing_purpose': 'digital_footprint_analysis'
-                }
-            }
-            
-            session_ref = db.collection('analysis_sessions').document(session_id)
-            session_ref.set(session_data)
-            
-            logging.info(f"Analysis session created: {session_id} for user: {user_id}")
-            return {'success': True, 'session_id': session_id, 'session_data': session_data}
-            
-        except Exception as e:
-            logging.error(f"Error creating analysis session: {e}")
-            return {'success': False, 'error': str(e)}
+    COLLECTION = 'analysis_sessions'
     
     @staticmethod
-    def update_progress(session_id: str, progress: int, status: str, step_description: str = None) -> Dict[str, Any]:
-        """Update analysis progress - ✅ FIXED: Safe for background threads"""
-        try:
-            session_ref = db.collection('analysis_sessions').document(session_id)
-            
-            # ✅ FIXED: Use datetime instead of SERVER_TIMESTAMP in background threads
-            update_data = {
-                'progress': progress,
-                'status': status,
-                'updated_at': datetime.now(timezone.utc)  # Use UTC datetime instead of SERVER_TIMESTAMP
+    def invalidate_cache(session_id: str) -> None:
+        """Drop a session from the in-process session cache"""
+        with _session_cache_lock:
+            # Entries are keyed by (session_id, view)
+            for view in SESSION_VIEWS:
+                _session_cache.pop((session_id, view), None)
+    
+    @classmethod
+    @firestore_op('creating analysis session')
+    def create_session(cls, user_id: str, url: str, analysis_type: str, batch=None) -> Dict[str, Any]:
+        """Create a new analysis session; with a batch the write is staged for the caller to commit"""
+        # Let Firestore allocate the document id instead of generating a UUID
+        session_ref = cls._coll().document()
+        session_id = session_ref.id
+        
+        session_data = {
+            'user_id': user_id,
+            'url': url,
+            'analysis_type': analysis_type,
+            'status': 'pending',
+            'progress': 0,
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP,
+            'expires_at': datetime.now(timezone.utc) + timedelta(hours=24),
+            'results': None,
+            'error_message': None,
+            'processing_steps': [],
+            'metadata': _SESSION_METADATA,
+            'privacy_settings': _SESSION_PRIVACY_SETTINGS
+        }
+        
+        if batch is not None:
+            batch.set(session_ref, session_data)
+        else:
+            session_ref.set(session_data, retry=FIRESTORE_RETRY)
+        
+        logging.info("Analysis session created: %s for user: %s", session_id, user_id)
+        return {'session_id': session_id, 'session_data': session_data}
+    
+    @classmethod
+    @firestore_op('updating progress for session {session_id}')
+    def update_progress(cls, session_id: str, progress: int, status: str, step_description: str = None) -> Dict[str, Any]:
+        """Buffer an analysis progress update; bursts are coalesced into one write - ✅ FIXED: Safe for background threads"""
+        step = None
+        if step_description:
+            step = {
+                'step': step_description,
+                'timestamp': datetime.now(timezone.utc),  # Use UTC datetime
+                'progress': progress
             }
-            
-            if step_description:
-                session_doc = session_ref.get()
-                if session_doc.exists:
-                    current_steps = session_doc.to_dict().get('processing_steps', [])
-                    current_steps.append({
-                        'step': step_description,
-                        'timestamp': datetime.now(timezone.utc),  # Use UTC datetime
-                        'progress': progress
-                    })
-                    update_data['processing_steps'] = current_steps
-            
-            session_ref.update(update_data)
-            
-            logging.info(f"Progress updated for session {session_id}: {progress}% - {status}")
-            return {'success': True}
-            
-        except Exception as e:
-            logging.error(f"Error updating progress for session {session_id}: {e}")
-            return {'success': False, 'error': str(e)}
+        
+        _progress_coalescer.add(session_id, progress, status, step)
+        
+        logging.info("Progress queued for session %s: %s%% - %s", session_id, progress, status)
+        return {}
     
-    @staticmethod
-    def save_results(session_id: str, results: Dict[str, Any]) -> Dict[str, Any]:
-        """Save analysis results"""
-        try:
-            session_ref = db.collection('analysis_sessions').document(session_id)
-            
-            update_data = {
+    @classmethod
+    @firestore_op('saving results for session {session_id}')
+    def save_results(cls, session_id: str, results: Dict[str, Any], batch=None) -> Dict[str, Any]:
+        """Save analysis results, moving oversized results into a subdocument.
+        
+        With a batch the writes are staged for the caller, who must invalidate the
+        session cache after committing. The subdocument is itself bound by Firestore's
+        1 MiB document limit, so results serializing to more than RESULTS_MAX_SIZE
+        are rejected with ValueError and nothing is written.
+        """
+        results_size = len(json.dumps(results, default=str))
+        if results_size > RESULTS_MAX_SIZE:
+            raise ValueError(
+                f"Analysis results are too large to store ({results_size} bytes, limit {RESULTS_MAX_SIZE})"
+            )
+        
+        session_ref = cls._coll().document(session_id)
+        completed_at = datetime.now(timezone.utc)  # Use UTC datetime
+        
+        # Fold any buffered progress steps into the terminal write
+        update_data = _progress_coalescer.drain(session_id)
+        update_data.update({
+            'results': results,
+            'status': 'completed',
+            'progress': 100,
+            'completed_at': completed_at
+        })
+        stamp_updated_at(update_data)
+        
+        if results_size > RESULTS_INLINE_LIMIT:
+            # Keep only the metadata inline; get_session loads the rest on demand
+            update_data['results'] = {'analysis_metadata': results.get('analysis_metadata', {})}
+            update_data['results_external'] = True
+            write_batch = batch if batch is not None else db.batch()
+            write_batch.set(session_ref.collection(RESULTS_COLLECTION).document(RESULTS_DOCUMENT), {
                 'results': results,
-                'status': 'completed',
-                'progress': 100,
-                'completed_at': datetime.now(timezone.utc),  # Use UTC datetime
-                'updated_at': datetime.now(timezone.utc)     # Use UTC datetime
-            }
-            
-            session_ref.update(update_data)
-            
-            logging.info(f"Results saved for session: {session_id}")
-            return {'success': True}
-            
-        except Exception as e:
-            logging.error(f"Error saving results for session {session_id}: {e}")
-            return {'success': False, 'error': str(e)}
+                'expires_at': completed_at + timedelta(hours=24)
+            })
+            write_batch.update(session_ref, update_data)
+            if batch is None:
+                write_batch.commit(retry=FIRESTORE_RETRY)
+        elif batch is not None:
+            batch.update(session_ref, update_data)
+        else:
+            session_ref.update(update_data, retry=FIRESTORE_RETRY)
+        if batch is None:
+            cls.invalidate_cache(session_id)
+        
+        logging.info("Results saved for session: %s", session_id)
+        return {}
     
-    @staticmethod
-    def mark_failed(session_id: str, error_message: str) -> Dict[str, Any]:
-        """Mark session as failed"""
-        try:
-            session_ref = db.collection('analysis_sessions').document(session_id)
-            
-            update_data = {
-                'status': 'failed',
-                'error_message': error_message,
-                'failed_at': datetime.now(timezone.utc),    # Use UTC datetime
-                'updated_at': datetime.now(timezone.utc)    # Use UTC datetime
-            }
-            
-            session_ref.update(update_data)
-            
-            logging.error(f"Session marked as failed {session_id}: {error_message}")
-            return {'success': True}
-            
-        except Exception as e:
-            logging.error(f"Error marking session as failed {session_id}: {e}")
-            return {'success': False, 'error': str(e)}
+    @classmethod
+    @firestore_op('marking session as failed {session_id}')
+    def mark_failed(cls, session_id: str, error_message: str, batch=None) -> Dict[str, Any]:
+        """Mark session as failed.
+        
+        With a batch the write is staged for the caller, who must invalidate the
+        session cache after committing.
+        """
+        session_ref = cls._coll().document(session_id)
+        
+        # Fold any buffered progress steps into the terminal write
+        update_data = _progress_coalescer.drain(session_id)
+        update_data.update({
+            'status': 'failed',
+            'error_message': error_message,
+            'failed_at': datetime.now(timezone.utc)    # Use UTC datetime
+        })
+        stamp_updated_at(update_data)
+        
+        if batch is not None:
+            batch.update(session_ref, update_data)
+        else:
+            session_ref.update(update_data, retry=FIRESTORE_RETRY)
+            cls.invalidate_cache(session_id)
+        
+        logging.error("Session marked as failed %s: %s", session_id, error_message)
+        return {}
     
-    @staticmethod
-    def get_session(session_id: str) -> Dict[str, Any]:
-        """Get analysis session data"""
-        try:
-            session_ref = db.collection('analysis_sessions').document(session_id)
-            session_doc = session_ref.get()
-            
-            if session_doc.exists:
+    @classmethod
+    @firestore_op('failing inactive session {session_id}')
+    def fail_if_active(cls, session_id: str, error_message: str) -> Dict[str, Any]:
+        """Mark a session failed only if it is still pending or processing; reports whether it did"""
+        session_ref = cls._coll().document(session_id)
+        update_data = stamp_updated_at({
+            'status': 'failed',
+            'error_message': error_message,
+            'failed_at': datetime.now(timezone.utc)
+        })
+        
+        # The status is re-read inside the transaction so a worker's terminal write is never overwritten
+        @firestore.transactional
+        def fail_in_transaction(transaction):
+            session_doc = session_ref.get(field_paths=['status'], transaction=transaction)
+            if not session_doc.exists or session_doc.to_dict().get('status') in TERMINAL_STATUSES:
+                return False
+            transaction.update(session_ref, update_data)
+            return True
+        
+        failed = fail_in_transaction(db.transaction())
+        cls.invalidate_cache(session_id)
+        
+        if failed:
+            logging.error("Session marked as failed %s: %s", session_id, error_message)
+        return {'failed': failed}
+    
+    @classmethod
+    @firestore_op('getting session {session_id}')
+    def get_session(cls, session_id: str, view: str = 'status') -> Dict[str, Any]:
+        """Get the fields of one SESSION_VIEWS view of a session in a single field-masked read.
+        
+        Views that include results_external also load externally stored results.
+        """
+        cache_key = (session_id, view)
+        cached = _cached_session(*cache_key)
+        if cached is not None:
+            return cached
+        
+        field_paths = SESSION_VIEWS[view]
+        session_ref = cls._coll().document(session_id)
+        session_doc = session_ref.get(field_paths=field_paths, retry=FIRESTORE_RETRY)
+        
+        if not session_doc.exists:
+            return _remember_gone(session_id, 'Session not found')
+        
+        session_data = session_doc.to_dict()
+        # The id lives on the document key, not in the stored fields
+        session_data['session_id'] = session_doc.id
+        
+        if is_expired(session_data):
+            return _remember_gone(session_id, 'Session expired')
+        
+        if 'results_external' in field_paths and session_data.get('results_external'):
+            results_doc = session_ref.collection(RESULTS_COLLECTION).document(RESULTS_DOCUMENT).get(retry=FIRESTORE_RETRY)
+            if results_doc.exists:
+                session_data['results'] = results_doc.to_dict().get('results')
+        
+        # Pending sessions are about to be picked up by the worker, so keep reading them fresh
+        if session_data.get('status') != 'pending':
+            with _session_cache_lock:
+                _session_cache[cache_key] = session_data
+        
+        return {'session': dict(session_data)}
+    
+    @classmethod
+    def watch_session(cls, session_id: str, callback):
+        """Listen for changes to a session document.
+        
+        callback receives the session dict on every change, or None once it is deleted.
+        Returns the Firestore Watch; call unsubscribe() on it to stop listening.
+        """
+        def on_snapshot(docs, changes, read_time):
+            for session_doc in docs:
                 session_data = session_doc.to_dict()
-                
-                # Handle timezone-aware datetime comparison
-                expires_at = session_data.get('expires_at')
-                if expires_at:
-                    expires_at = normalize_datetime(expires_at)
-                    current_time = normalize_datetime(datetime.now(timezone.utc))
-                    
-                    if expires_at < current_time:
-                        logging.warning(f"Session expired: {session_id}")
-                        return {'success': False, 'error': 'Session expired'}
-                
-                return {'success': True, 'session': session_data}
-            else:
-                logging.warning(f"Session not found: {session_id}")
-                return {'success': False, 'error': 'Session not found'}
-                
-        except Exception as e:
-            logging.error(f"Error getting session {session_id}: {e}")
-            return {'success': False, 'error': str(e)}
+                session_data['session_id'] = session_doc.id
+                callback(session_data)
+            if not docs:
+                callback(None)
+        
+        return cls._coll().document(session_id).on_snapshot(on_snapshot)
     
-    @staticmethod
-    def get_user_sessions(user_id: str, limit: int = 10) -> Dict[str, Any]:
-        """Get analysis sessions for a specific user"""
-        try:
-            sessions_ref = db.collection('analysis_sessions')
-            query = sessions_ref.where('user_id', '==', user_id).limit(limit)
-            
-            sessions = []
-            for doc in query.stream():
-                session_data = doc.to_dict()
-                session_data['session_id'] = doc.id
-                sessions.append(session_data)
-            
-            sessions.sort(key=lambda x: x.get('created_at', datetime.min), reverse=True)
-            
-            logging.info(f"Retrieved {len(sessions)} sessions for user: {user_id}")
-            return {'success': True, 'sessions': sessions}
-            
-        except Exception as e:
-            logging.error(f"Error getting user sessions for {user_id}: {e}")
-            return {'success': False, 'error': str(e), 'sessions': []}
+    @classmethod
+    def iter_user_sessions(cls, user_id: str, limit: int = 10, start_after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield a user's session summaries newest first as they arrive from the stream.
+        
+        start_after is the session_id of the last summary on the previous page; an
+        unknown id yields an empty page.
+        """
+        # Ordered on the server (needs the user_id/created_at composite index), so no Python sort
+        query = cls._coll().where('user_id', '==', user_id).select(
+            SESSION_SUMMARY_FIELDS
+        ).order_by(
+            'created_at', direction=firestore.Query.DESCENDING
+        ).limit(limit)
+        
+        if start_after:
+            # The cursor only needs the ordering field; the user_id filter still applies after it
+            cursor = cls._coll().document(start_after).get(field_paths=['created_at'], retry=FIRESTORE_RETRY)
+            if not cursor.exists:
+                return
+            query = query.start_after(cursor)
+        
+        for doc in query.stream():
+            session_data = doc.to_dict()
+            session_data['session_id'] = doc.id
+            yield session_data
     
-    @staticmethod
-    def delete_session(session_id: str) -> Dict[str, Any]:
-        """Delete analysis session"""
-        try:
-            session_ref = db.collection('analysis_sessions').document(session_id)
-            session_ref.delete()
-            
-            logging.info(f"Session deleted: {session_id}")
-            return {'success': True}
-            
-        except Exception as e:
-            logging.error(f"Error deleting session {session_id}: {e}")
-            return {'success': False, 'error': str(e)}
+    @classmethod
+    @firestore_op('getting user sessions for {user_id}', sessions=[])
+    def get_user_sessions(cls, user_id: str, limit: int = 10, start_after: Optional[str] = None) -> Dict[str, Any]:
+        """Get session summaries for a specific user; results only carry analysis_metadata"""
+        sessions = list(cls.iter_user_sessions(user_id, limit, start_after=start_after))
+        
+        logging.info("Retrieved %s sessions for user: %s", len(sessions), user_id)
+        return {'sessions': sessions}
     
-    @staticmethod
-    def cleanup_expired_sessions() -> Dict[str, Any]:
-        """Clean up expired sessions"""
+    @classmethod
+    @firestore_op('deleting session {session_id}')
+    def delete_session(cls, session_id: str) -> Dict[str, Any]:
+        """Delete analysis session along with any externally stored results"""
+        session_ref = cls._coll().document(session_id)
+        batch = db.batch()
+        batch.delete(session_ref.collection(RESULTS_COLLECTION).document(RESULTS_DOCUMENT))
+        batch.delete(session_ref)
+        batch.commit(retry=FIRESTORE_RETRY)
+        # Buffered progress for the session would only fail against the deleted document
+        _progress_coalescer.drain(session_id)
+        cls.invalidate_cache(session_id)
+        with _session_cache_lock:
+            _gone_sessions[session_id] = 'Session not found'
+        
+        logging.info("Session deleted: %s", session_id)
+        return {}
+    
+    @classmethod
+    @firestore_op('cleaning up expired sessions')
+    def cleanup_expired_sessions(cls) -> Dict[str, Any]:
+        """Clean up expired sessions, paging through the backlog and deleting through a BulkWriter"""
+        now = datetime.now(timezone.utc)
+        # Deletes only need references; expires_at is kept so start_after() can build the cursor
+        # and results_external says whether a results subdocument has to go too
+        query = cls._coll().where(
+            'expires_at', '<', now
+        ).select(['expires_at', 'results_external']).order_by('expires_at').limit(CLEANUP_PAGE_SIZE)
+        
+        # BulkWriter pipelines the deletes over parallel batches with its own retry/backoff
+        bulk_writer = db.bulk_writer()
+        deleted_count = 0
         try:
-            cutoff_time = datetime.now(timezone.utc) - timedelta(hours=24)
-            
-            # ✅ FIXED: Use where() method instead of filter()
-            expired_sessions = db.collection('analysis_sessions').where(
-                'created_at', '<', cutoff_time
-            ).limit(100)
-            
-            deleted_count = 0
-            for session_doc in expired_sessions.stream():
-                session_doc.reference.delete()
-                deleted_count += 1
-            
-            logging.info(f"Cleaned up {deleted_count} expired sessions")
-            return {'success': True, 'deleted_count': deleted_count}
-            
-        except Exception as e:
-            logging.error(f"Error cleaning up expired sessions: {e}")
-            return {'success': False, 'error': str(e)}
+            page = list(query.stream())
+            while page:
+                for session_doc in page:
+                    # DocumentSnapshot.get raises KeyError for a missing field, and inline results never set it
+                    if (session_doc.to_dict() or {}).get('results_external'):
+                        bulk_writer.delete(session_doc.reference.collection(RESULTS_COLLECTION).document(RESULTS_DOCUMENT))
+                    bulk_writer.delete(session_doc.reference)
+                deleted_count += len(page)
+                if len(page) < CLEANUP_PAGE_SIZE:
+                    break
+                page = list(query.start_after(page[-1]).stream())
+        finally:
+            # Flushes everything already enqueued, even if paging failed part-way
+            bulk_writer.close()
+        
+        logging.info("Cleaned up %s expired sessions", deleted_count)
+        return {'deleted_count': deleted_count}
 
-class AuditLog:
+_audit_queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+_audit_writer = None
+_audit_commit_pool = None
+_audit_writer_lock = threading.Lock()
+
+def _write_audit_batch(entries: List[Tuple[Any, Dict[str, Any]]]) -> None:
+    """Commit a list of (log_ref, log_data) audit entries as a single batch, retrying transient failures"""
+    try:
+        batch = db.batch()
+        for log_ref, log_data in entries:
+            batch.set(log_ref, log_data)
+        batch.commit(retry=FIRESTORE_RETRY)
+    except Exception as e:
+        logging.error("Dropping %s audit logs after failed write: %s", len(entries), e)
+
+def _audit_drain():
+    """Collect queued audit logs for up to AUDIT_FLUSH_INTERVAL and write them in one batch"""
+    while True:
+        entries = [_audit_queue.get()]
+        deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL
+        while len(entries) < AUDIT_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entries.append(_audit_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            # Commit on the pool so a slow batch doesn't stall draining the queue
+            _audit_commit_pool.submit(_write_audit_batch, entries)
+        except RuntimeError:
+            # The pool refuses new work once the interpreter is shutting down
+            _write_audit_batch(entries)
+
+def _ensure_audit_writer():
+    """Start the background audit writer thread and commit pool on first use"""
+    global _audit_writer, _audit_commit_pool
+    if _audit_writer is not None:
+        return
+    with _audit_writer_lock:
+        if _audit_writer is None:
+            _audit_commit_pool = ThreadPoolExecutor(max_workers=AUDIT_WRITE_WORKERS)
+            _audit_writer = threading.Thread(target=_audit_drain, daemon=True)
+            _audit_writer.start()
+
+def flush_audit():
+    """Synchronously write any audit logs still waiting in the queue"""
+    entries = []
+    while True:
+        try:
+            entries.append(_audit_queue.get_nowait())
+        except queue.Empty:
+            break
+        if len(entries) == AUDIT_BATCH_SIZE:
+            _write_audit_batch(entries)
+            entries = []
+    if entries:
+        _write_audit_batch(entries)
+
+atexit.register(flush_audit)
+
+class AuditLog(FirestoreModel):
     """Audit log model for compliance and monitoring"""
     
-    @staticmethod
-    def create_log(user_id: str, action: str, details: Dict[str, Any], ip_address: str = None) -> Dict[str, Any]:
-        """Create audit log entry - ✅ FIXED: Safe for background threads"""
+    COLLECTION = 'audit_logs'
+    
+    @classmethod
+    @firestore_op('creating audit log')
+    def create_log(cls, user_id: str, action: str, details: Dict[str, Any], ip_address: str = None, batch=None) -> Dict[str, Any]:
+        """Queue an audit log entry for the background writer, or stage it in the caller's batch - ✅ FIXED: Safe for background threads"""
+        to_logging = AUDIT_LOG_SINK == 'logging'
+        
+        # Without a Firestore client there is nowhere to send the log, so skip building it
+        if db is None and not to_logging:
+            return {'success': False, 'error': 'Firestore not initialized'}
+        
+        # user_agent and session_id are stored once at the top level rather than again in details
+        user_agent = details.get('user_agent')
+        log_data = {
+            'user_id': user_id,
+            'action': action,
+            'details': {key: value for key, value in details.items() if key not in AUDIT_HOISTED_FIELDS},
+            'ip_address': ip_address,
+            'timestamp': datetime.now(timezone.utc),  # Event time, not the time the batch is committed
+            'user_agent': user_agent[:AUDIT_USER_AGENT_MAX_LENGTH] if user_agent else user_agent,
+            'session_id': details.get('session_id'),
+            # One small int instead of a map of three booleans; see the COMPLIANCE_* bits
+            'compliance_flags': (
+                COMPLIANCE_GDPR_RELEVANT
+                | (COMPLIANCE_DATA_PROCESSING if action in DATA_PROCESSING_ACTIONS else 0)
+                | (COMPLIANCE_USER_CONSENT if details.get('consent_given') else 0)
+            )
+        }
+        
+        if to_logging:
+            # Events go to the log sink only; a caller's batch keeps just its own writes
+            audit_logger.info(json.dumps(log_data, default=str))
+            return {}
+        
+        # Firestore auto-id, allocated locally without a round-trip
+        log_ref = cls._coll().document()
+        log_id = log_ref.id
+        
+        if batch is not None:
+            batch.set(log_ref, log_data)
+            return {'log_id': log_id}
+        
+        _ensure_audit_writer()
         try:
-            log_id = str(uuid.uuid4())
-            
-            log_data = {
-                'log_id': log_id,
-                'user_id': user_id,
-                'action': action,
-                'details': details,
-                'ip_address': ip_address,
-                'timestamp': datetime.now(timezone.utc),  # Use UTC datetime instead of SERVER_TIMESTAMP
-                'user_agent': details.get('user_agent'),
-                'session_id': details.get('session_id'),
-                'compliance_flags': {
-                    'gdpr_relevant': True,
-                    'data_processing': action in ['analysis_start', 'data_collection', 'results_generated'],
-                    'user_consent': details.get('consent_given', False)
-                }
-            }
-            
-            db.collection('audit_logs').document(log_id).set(log_data)
-            
-            logging.info(f"Audit log created: {action} for user: {user_id}")
-            return {'success': True, 'log_id': log_id}
-            
-        except Exception as e:
-            logging.error(f"Error creating audit log: {e}")
-            return {'success': False, 'error': str(e)}
+            _audit_queue.put_nowait((log_ref, log_data))
+        except queue.Full:
+            # Don't lose compliance records when the writer falls behind
+            logging.warning("Audit log queue full, writing synchronously")
+            log_ref.set(log_data, retry=FIRESTORE_RETRY)
+        
+        logging.info("Audit log queued: %s for user: %s", action, user_id)
+        return {'log_id': log_id}
 
 # Export all model classes
-__all__ = ['FirestoreUser', 'AnalysisSession', 'AuditLog']
+__all__ = ['FirestoreUser', 'AnalysisSession', 'AuditLog', 'flush_audit']
@@ -1,37 +1,355 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context, url_for
 from middleware.firebase_auth import require_auth
 from services.ai_analysis_service import AIAnalysisService
-from models.firestore_models import AnalysisSession, FirestoreUser, AuditLog
+from models.firestore_models import AnalysisSession, FirestoreUser, AuditLog, FIRESTORE_RETRY, TERMINAL_STATUSES, normalize_datetime
+from config.firebase_config import db
 import logging
+import queue
 import threading
 import time
-from datetime import datetime
-import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import os
 from dotenv import load_dotenv
+from limits import RateLimitItemPerDay
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Create blueprint
 analysis_bp = Blueprint('analysis', __name__)
 
+# Analysis types accepted by /start, in the order they are advertised
+ANALYSIS_TYPES = ('comprehensive', 'privacy_only', 'sentiment', 'basic')
+VALID_ANALYSIS_TYPES = frozenset(ANALYSIS_TYPES)
+INVALID_ANALYSIS_TYPE_ERROR = f'Invalid analysis type. Must be one of: {", ".join(ANALYSIS_TYPES)}'
+
+# Analyses per day for each subscription tier; unknown tiers get the free allowance
+DAILY_ANALYSIS_LIMITS = {
+    'free': 10
+}
+
+# Background analyses share a fixed pool instead of a thread per request
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 8))
+analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix='analysis')
+# New analyses are refused while this many are already waiting for a worker
+ANALYSIS_QUEUE_LIMIT = int(os.environ.get('ANALYSIS_QUEUE_LIMIT', 4 * ANALYSIS_WORKERS))
+ANALYSIS_QUEUE_RETRY_AFTER = 30
+# One slot per analysis running or waiting for a worker, released when it finishes
+_analysis_slots = threading.BoundedSemaphore(ANALYSIS_WORKERS + ANALYSIS_QUEUE_LIMIT)
+
+# Queued or running analyses in this process: session_id -> (future, cancel event)
+_active_analyses = {}
+
+# Active sessions with no write for this long, and no worker in this process, are treated
+# as abandoned and marked failed
+STALLED_ANALYSIS_TIMEOUT = timedelta(minutes=10)
+ANALYSIS_INTERRUPTED_ERROR = 'Analysis was interrupted. Please start it again.'
+
+# Seconds between SSE comment frames that keep idle /stream connections open
+STREAM_KEEPALIVE_SECONDS = 15
+# Every open /stream holds a request thread (16 per gunicorn worker, see Procfile) until
+# its analysis ends; past this many, clients are sent back to polling /status so the
+# remaining threads keep serving the other endpoints
+STREAM_MAX_CONCURRENT = int(os.environ.get('STREAM_MAX_CONCURRENT', 8))
+STREAM_BUSY_RETRY_AFTER = 5
+_stream_slots = threading.BoundedSemaphore(STREAM_MAX_CONCURRENT)
+
 # Initialize AI analysis service with real scraping and Gemini integration
 ai_service = AIAnalysisService()
 
+def last_updated(session_data):
+    """Latest write time of a session; updated_at is skipped when a step or terminal timestamp covers it"""
+    steps = session_data.get('processing_steps') or []
+    candidates = [
+        session_data.get('updated_at'),
+        session_data.get('completed_at'),
+        session_data.get('failed_at'),
+        steps[-1].get('timestamp') if steps else None
+    ]
+    return max((timestamp for timestamp in candidates if timestamp), default=None)
+
+def build_status_payload(session_id, session_data):
+    """Status response body shared by /status polling and the /stream event feed"""
+    # Enhanced status information for real analysis
+    response_data = {
+        'success': True,
+        'session_id': session_id,
+        'status': session_data.get('status', 'unknown'),
+        'progress': session_data.get('progress', 0),
+        'created_at': session_data.get('created_at'),
+        'updated_at': last_updated(session_data),
+        'url': session_data.get('url'),
+        'analysis_type': session_data.get('analysis_type'),
+        'processing_steps': session_data.get('processing_steps', []),
+        'is_real_analysis': True,  # Indicate this is real analysis
+        'features_enabled': [
+            'Web Scraping',
+            'AI Analysis',
+            'Real-time Processing'
+        ]
+    }
+
+    # Include error message if failed
+    if session_data.get('status') == 'failed':
+        response_data['error'] = session_data.get('error_message', 'Real analysis failed')
+
+    # Add completion metadata if available
+    if session_data.get('status') == 'completed':
+        results = session_data.get('results', {})
+        metadata = results.get('analysis_metadata', {})
+        if metadata:
+            response_data['analysis_metadata'] = {
+                'processing_time': metadata.get('processing_time', 0),
+                'data_source': metadata.get('data_source', 'live_scraping'),
+                'platform_detected': metadata.get('platform_detected', 'unknown'),
+                'confidence_score': metadata.get('confidence_score', 0),
+                'ai_model': metadata.get('ai_model', 'Gemini Pro')
+            }
+    
+    return response_data
+
+def fail_if_stalled(session_id, session_data):
+    """Persist a failure for an active session whose worker is gone; returns the session as it now stands.
+    
+    A worker lost mid-run (e.g. a process restart) never writes a terminal state, which would
+    leave the session pending or processing for status, history and results alike.
+    """
+    # Queued and running analyses of this process are alive however long they have been quiet
+    if session_data.get('status') not in ('pending', 'processing') or session_id in _active_analyses:
+        return session_data
+    last_activity = normalize_datetime(last_updated(session_data) or session_data.get('created_at'))
+    if not last_activity or datetime.now(timezone.utc) - last_activity <= STALLED_ANALYSIS_TIMEOUT:
+        return session_data
+    
+    logger.warning("Session %s has been inactive since %s; marking it failed", session_id, last_activity)
+    fail_result = AnalysisSession.fail_if_active(session_id, ANALYSIS_INTERRUPTED_ERROR)
+    if fail_result['success'] and fail_result['failed']:
+        return {**session_data, 'status': 'failed', 'error_message': ANALYSIS_INTERRUPTED_ERROR}
+    return session_data
+
+def consume_daily_quota(user_id, daily_limit):
+    """Atomically take one analysis from a user's daily allowance; returns (allowed, retry_after_seconds)"""
+    quota = RateLimitItemPerDay(daily_limit)
+    for limiter in current_app.extensions.get('limiter', ()):
+        if not limiter.limiter.hit(quota, 'analysis-start', user_id):
+            reset_time, _ = limiter.limiter.get_window_stats(quota, 'analysis-start', user_id)
+            return False, max(1, int(reset_time - time.time()))
+    return True, 0
+
+def refund_daily_quota(user_id, daily_limit):
+    """Give back the unit consume_daily_quota took when the analysis it paid for was never created"""
+    quota = RateLimitItemPerDay(daily_limit)
+    for limiter in current_app.extensions.get('limiter', ()):
+        # Fixed-window counters (Flask-Limiter's default strategy) are a plain INCR, so a negative one undoes a hit
+        limiter.limiter.storage.incr(quota.key_for('analysis-start', user_id), quota.get_expiry(), amount=-1)
+
+def cancel_analysis(session_id):
+    """Stop a queued or running analysis at its next safe point; returns whether one was found"""
+    active = _active_analyses.pop(session_id, None)
+    if active is None:
+        return False
+    future, cancel_event = active
+    cancel_event.set()
+    # Only succeeds while still queued; a running analysis checks the event instead
+    future.cancel()
+    return True
+
+def format_history_session(session):
+    """History entry for one session summary, as shown in the frontend's history list"""
+    formatted_session = {
+        'session_id': session.get('session_id'),
+        'url': session.get('url'),
+        'analysis_type': session.get('analysis_type'),
+        'status': session.get('status'),
+        'progress': session.get('progress', 0),
+        'created_at': session.get('created_at'),
+        'completed_at': session.get('completed_at'),
+        'has_results': bool(session.get('results')),
+        'is_real_analysis': True,  # All new analyses use real scraping
+        'features': ['Web Scraping', 'AI Analysis']
+    }
+    
+    # Include error message for failed analyses
+    if session.get('status') == 'failed':
+        formatted_session['error_message'] = session.get('error_message')
+    
+    # Add analysis metadata if available
+    if session.get('results'):
+        results = session.get('results', {})
+        metadata = results.get('analysis_metadata', {})
+        if metadata:
+            formatted_session['metadata'] = {
+                'platform_detected': metadata.get('platform_detected', 'unknown'),
+                'processing_time': metadata.get('processing_time', 0),
+                'data_source': metadata.get('data_source', 'live_scraping'),
+                'ai_model': metadata.get('ai_model', 'Gemini Pro')
+            }
+    
+    return formatted_session
+
+# Runs outside any Flask request context, so it only takes plain values
+def run_real_analysis(user_id, ip_address, user_agent, session_id, url, analysis_type, cancel_event=None):
+    """Enhanced background analysis function with real scraping and AI analysis.
+    
+    Setting cancel_event stops the analysis before its next Firestore write.
+    """
+    cancel_event = cancel_event or threading.Event()
+    try:
+        if cancel_event.is_set():
+            return
+        logger.info("Starting REAL SCRAPING analysis for session: %s", session_id)
+        start_time = time.monotonic()
+        
+        # Update progress: Starting
+        AnalysisSession.update_progress(
+            session_id=session_id,
+            progress=5,
+            status='processing',
+            step_description='🚀 Initializing real web scraping engine'
+        )
+        
+        def report_progress(progress, step_desc):
+            if cancel_event.is_set():
+                return
+            AnalysisSession.update_progress(
+                session_id=session_id,
+                progress=progress,
+                status='processing',
+                step_description=step_desc
+            )
+        
+        # Perform REAL AI analysis with web scraping
+        logger.info("🤖 Running REAL AI analysis with scraping for session: %s", session_id)
+        analysis_results = ai_service.analyze_profile(url, analysis_type, progress_cb=report_progress)
+        
+        # The session was deleted while scraping; there is nothing left to write to
+        if cancel_event.is_set():
+            logger.info("Analysis cancelled for session: %s", session_id)
+            return
+        
+        if analysis_results.get('success', False):
+            # Enhanced results processing
+            results = analysis_results['results']
+            
+            # Add metadata about the real analysis
+            results['analysis_metadata'] = {
+                'is_real_analysis': True,
+                'scraping_successful': True,
+                'ai_model': 'Gemini Pro 1.5',
+                'processing_time': round(time.monotonic() - start_time, 2),
+                'data_source': 'live_scraping',
+                'analysis_timestamp': datetime.utcnow().isoformat(),
+                'platform_detected': results.get('platform', 'unknown'),
+                'confidence_score': results.get('confidence_score', 85)
+            }
+            
+            # Results and the completion audit log land in one commit
+            batch = db.batch()
+            save_result = AnalysisSession.save_results(session_id, results, batch=batch)
+            if not save_result['success']:
+                # Nothing was staged, so don't commit an audit log for an outcome that was never written
+                raise RuntimeError(f"Could not save results: {save_result['error']}")
+            
+            # Create completion audit log
+            completion_details = {
+                'session_id': session_id,
+                'analysis_completed': True,
+                'results_generated': True,
+                'processing_time_seconds': time.monotonic() - start_time,
+                'user_agent': user_agent,
+                'scraping_successful': True,
+                'ai_analysis_successful': True,
+                'data_points_extracted': results.get('scraped_data', {}).get('data_points_found', 0)
+            }
+            AuditLog.create_log(
+                user_id=user_id,
+                action='analysis_completed_with_scraping',
+                details=completion_details,
+                ip_address=ip_address,
+                batch=batch
+            )
+            batch.commit(retry=FIRESTORE_RETRY)
+            # Invalidated only now, so a concurrent read can't re-cache the pre-commit status
+            AnalysisSession.invalidate_cache(session_id)
+            
+            logger.info("✅ REAL ANALYSIS completed successfully for session: %s", session_id)
+        else:
+            # Mark as failed
+            error_msg = analysis_results.get('error', 'Real analysis failed due to unknown error')
+            batch = db.batch()
+            fail_result = AnalysisSession.mark_failed(session_id, error_msg, batch=batch)
+            if not fail_result['success']:
+                raise RuntimeError(f"Could not mark analysis failed: {fail_result['error']}")
+            
+            # Create failure audit log
+            failure_details = {
+                'session_id': session_id,
+                'error_message': error_msg,
+                'analysis_failed': True,
+                'scraping_attempted': True,
+                'user_agent': user_agent
+            }
+            AuditLog.create_log(
+                user_id=user_id,
+                action='real_analysis_failed',
+                details=failure_details,
+                ip_address=ip_address,
+                batch=batch
+            )
+            batch.commit(retry=FIRESTORE_RETRY)
+            AnalysisSession.invalidate_cache(session_id)
+            
+            logger.error("❌ Real analysis failed for session %s: %s", session_id, error_msg)
+    
+    except Exception as e:
+        if cancel_event.is_set():
+            logger.info("Analysis cancelled for session %s after error: %s", session_id, e)
+            return
+        logger.exception("🚨 Background real analysis error for session %s", session_id)
+        AnalysisSession.mark_failed(session_id, f"Internal real analysis error: {str(e)}")
+        
+        # Create error audit log
+        error_details = {
+            'session_id': session_id,
+            'internal_error': str(e),
+            'analysis_failed': True,
+            'real_scraping_attempted': True,
+            'user_agent': user_agent
+        }
+        AuditLog.create_log(
+            user_id=user_id,
+            action='real_analysis_error',
+            details=error_details,
+            ip_address=ip_address
+        )
+
 @analysis_bp.route('/start', methods=['POST'])
 @require_auth
 def start_analysis():
     """Start a new analysis session with real web scraping and AI analysis"""
+    # Checked after authentication; answered directly because require_auth would turn a
+    # raised HTTP error into a 401
+    if not request.is_json:
+        return unsupported_media_type(None)
+    try:
+        # Malformed JSON comes back as None instead of raising
+        data = request.get_json(silent=True)
+    except RequestEntityTooLarge as e:
+        return payload_too_large(e)
+    
+    slot_held = False
     try:
-        data = request.get_json()
         user_id = request.user_id
         
-        logging.info(f"Received analysis request from user {user_id}: {data}")
+        logger.info("Received analysis request from user %s: %s", user_id, data)
         
         # Validate request data
-        if not data:
-            logging.error("No JSON data received")
+        if not data or not isinstance(data, dict):
+            logger.error("No JSON data received")
             return jsonify({
                 'success': False,
                 'error': 'No data provided'
@@ -41,11 +359,11 @@ def start_analysis():
         url = data.get('url') or data.get('social_media_url', '').strip()
         analysis_type = data.get('analysis_type', 'comprehensive').strip()
         
-        logging.info(f"Extracted URL: '{url}', Analysis Type: '{analysis_type}'")
+        logger.info("Extracted URL: '%s', Analysis Type: '%s'", url, analysis_type)
         
         # Validate URL
         if not url:
-            logging.error("URL is empty or missing")
+            logger.error("URL is empty or missing")
             return jsonify({
                 'success': False,
                 'error': 'Social media URL is required'
@@ -59,23 +377,39 @@ def start_analysis():
             }), 400
             
         # Validate analysis type
-        valid_types = ['comprehensive', 'privacy_only', 'sentiment', 'basic']
-        if analysis_type not in valid_types:
-            logging.error(f"Invalid analysis type: {analysis_type}")
+        if analysis_type not in VALID_ANALYSIS_TYPES:
+            logger.error("Invalid analysis type: %s", analysis_type)
             return jsonify({
                 'success': False,
-                'error': f'Invalid analysis type. Must be one of: {", ".join(valid_types)}'
+                'error': INVALID_ANALYSIS_TYPE_ERROR
             }), 400
         
+        # Shed load before touching Firestore or the quota while the pool is backed up;
+        # the slot is handed to the analysis on submit and given back on any earlier exit
+        slot_held = _analysis_slots.acquire(blocking=False)
+        if not slot_held:
+            logger.warning("Analysis queue full, rejecting start for user %s", user_id)
+            response = jsonify({
+                'success': False,
+                'error': 'The analysis service is busy. Please try again shortly.'
+            })
+            response.headers['Retry-After'] = str(ANALYSIS_QUEUE_RETRY_AFTER)
+            return response, 503
+        
+        # New users, the session, its audit log and the usage increment are all written in a single commit
+        batch = db.batch()
+        
         # Get user data and check usage limits
         user_result = FirestoreUser.get_user(user_id)
-        if not user_result['success']:
-            # Create user if doesn't exist
+        created_user = not user_result['success']
+        if created_user:
+            # Create user if doesn't exist; staged so sign-up adds no round-trip of its own
             user_info = getattr(request, 'user_info', {})
             create_result = FirestoreUser.create_user(
                 user_id=user_id,
                 email=user_info.get('email', 'unknown@example.com'),
-                display_name=user_info.get('name', 'Unknown User')
+                display_name=user_info.get('name', 'Unknown User'),
+                batch=batch
             )
             if not create_result['success']:
                 return jsonify({
@@ -89,24 +423,42 @@ def start_analysis():
         # Check usage limits
         daily_usage = user_data.get('daily_usage', 0)
         subscription_tier = user_data.get('subscription_tier', 'free')
-        daily_limit = 10
+        daily_limit = DAILY_ANALYSIS_LIMITS.get(subscription_tier, DAILY_ANALYSIS_LIMITS['free'])
         
         if daily_usage >= daily_limit:
-            logging.warning(f"User {user_id} exceeded daily limit: {daily_usage}/{daily_limit}")
+            logger.warning("User %s exceeded daily limit: %s/%s", user_id, daily_usage, daily_limit)
             return jsonify({
                 'success': False,
                 'error': f'Daily analysis limit reached ({daily_limit}). Upgrade your plan to continue.'
             }), 429
         
-        # Create analysis session
+        # The Firestore counter is read before it is incremented, so concurrent starts could
+        # both pass the check above; the limiter's storage takes the quota atomically
+        allowed, retry_after = consume_daily_quota(user_id, daily_limit)
+        if not allowed:
+            logger.warning("User %s exceeded daily limit in the rate limiter", user_id)
+            response = jsonify({
+                'success': False,
+                'error': f'Daily analysis limit reached ({daily_limit}). Upgrade your plan to continue.'
+            })
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
+        
+        # Extract request context data BEFORE starting background thread
+        ip_address = request.remote_addr
+        user_agent = request.headers.get('User-Agent')
+        
+        # Stage the analysis session and its audit log
         session_result = AnalysisSession.create_session(
             user_id=user_id,
             url=url,
-            analysis_type=analysis_type
+            analysis_type=analysis_type,
+            batch=batch
         )
         
         if not session_result['success']:
-            logging.error(f"Failed to create session: {session_result['error']}")
+            logger.error("Failed to create session: %s", session_result['error'])
+            refund_daily_quota(user_id, daily_limit)
             return jsonify({
                 'success': False,
                 'error': 'Failed to create analysis session'
@@ -114,15 +466,6 @@ def start_analysis():
         
         session_id = session_result['session_id']
         
-        # Increment user usage
-        usage_result = FirestoreUser.increment_usage(user_id)
-        if not usage_result['success']:
-            logging.warning(f"Failed to increment usage for user {user_id}: {usage_result['error']}")
-        
-        # Extract request context data BEFORE starting background thread
-        ip_address = request.remote_addr
-        user_agent = request.headers.get('User-Agent')
-        
         # Create audit log (within request context)
         audit_details = {
             'url': url,
@@ -137,141 +480,51 @@ def start_analysis():
             user_id=user_id,
             action='analysis_start_real_scraping',
             details=audit_details,
-            ip_address=ip_address
+            ip_address=ip_address,
+            batch=batch
         )
         
-        # Start real analysis in background thread WITHOUT flask context dependencies
-        def run_real_analysis(user_id, ip_address, user_agent, session_id, url, analysis_type):
-            """Enhanced background analysis function with real scraping and AI analysis"""
-            try:
-                logging.info(f"Starting REAL SCRAPING analysis for session: {session_id}")
-                start_time = time.time()
-                
-                # Update progress: Starting
-                AnalysisSession.update_progress(
-                    session_id=session_id,
-                    progress=5,
-                    status='processing',
-                    step_description='🚀 Initializing real web scraping engine'
-                )
-                time.sleep(1)
-                
-                # Enhanced analysis steps with real scraping
-                analysis_steps = [
-                    (10, '🔍 Validating URL and detecting platform'),
-                    (15, '🌐 Establishing secure connection to target'),
-                    (25, '📊 Scraping public profile data'),
-                    (35, '🤖 Processing scraped data with Gemini AI'),
-                    (50, '🧠 AI-powered sentiment and content analysis'),
-                    (65, '🛡️ Evaluating privacy risks from real data'),
-                    (75, '📈 Generating behavioral insights'),
-                    (85, '✨ AI-enhanced recommendation generation'),
-                    (95, '🔒 Applying ethical boundaries and data protection')
-                ]
-                
-                for progress, step_desc in analysis_steps:
-                    AnalysisSession.update_progress(
-                        session_id=session_id,
-                        progress=progress,
-                        status='processing',
-                        step_description=step_desc
-                    )
-                    # Variable delay to simulate real processing
-                    delay = 1.5 if progress < 25 else (3 if progress < 65 else 2)
-                    time.sleep(delay)
-                
-                # Perform REAL AI analysis with web scraping
-                logging.info(f"🤖 Running REAL AI analysis with scraping for session: {session_id}")
-                analysis_results = ai_service.analyze_profile(url, analysis_type)
-                
-                if analysis_results.get('success', False):
-                    # Enhanced results processing
-                    results = analysis_results['results']
-                    
-                    # Add metadata about the real analysis
-                    results['analysis_metadata'] = {
-                        'is_real_analysis': True,
-                        'scraping_successful': True,
-                        'ai_model': 'Gemini Pro 1.5',
-                        'processing_time': round(time.time() - start_time, 2),
-                        'data_source': 'live_scraping',
-                        'analysis_timestamp': datetime.utcnow().isoformat(),
-                        'platform_detected': results.get('platform', 'unknown'),
-                        'confidence_score': results.get('confidence_score', 85)
-                    }
-                    
-                    # Save enhanced results
-                    AnalysisSession.save_results(session_id, results)
-                    
-                    # Create completion audit log
-                    completion_details = {
-                        'session_id': session_id,
-                        'analysis_completed': True,
-                        'results_generated': True,
-                        'processing_time_seconds': time.time() - start_time,
-                        'user_agent': user_agent,
-                        'scraping_successful': True,
-                        'ai_analysis_successful': True,
-                        'data_points_extracted': results.get('scraped_data', {}).get('data_points_found', 0)
-                    }
-                    AuditLog.create_log(
-                        user_id=user_id,
-                        action='analysis_completed_with_scraping',
-                        details=completion_details,
-                        ip_address=ip_address
-                    )
-                    
-                    logging.info(f"✅ REAL ANALYSIS completed successfully for session: {session_id}")
-                else:
-                    # Mark as failed
-                    error_msg = analysis_results.get('error', 'Real analysis failed due to unknown error')
-                    AnalysisSession.mark_failed(session_id, error_msg)
-                    
-                    # Create failure audit log
-                    failure_details = {
-                        'session_id': session_id,
-                        'error_message': error_msg,
-                        'analysis_failed': True,
-                        'scraping_attempted': True,
-                        'user_agent': user_agent
-                    }
-                    AuditLog.create_log(
-                        user_id=user_id,
-                        action='real_analysis_failed',
-                        details=failure_details,
-                        ip_address=ip_address
-                    )
-                    
-                    logging.error(f"❌ Real analysis failed for session {session_id}: {error_msg}")
-                    
-            except Exception as e:
-                logging.error(f"🚨 Background real analysis error for session {session_id}: {str(e)}")
-                AnalysisSession.mark_failed(session_id, f"Internal real analysis error: {str(e)}")
-                
-                # Create error audit log
-                error_details = {
-                    'session_id': session_id,
-                    'internal_error': str(e),
-                    'analysis_failed': True,
-                    'real_scraping_attempted': True,
-                    'user_agent': user_agent
-                }
-                AuditLog.create_log(
-                    user_id=user_id,
-                    action='real_analysis_error',
-                    details=error_details,
-                    ip_address=ip_address
-                )
-        
-        # Start enhanced background analysis with real scraping
-        analysis_thread = threading.Thread(
-            target=run_real_analysis, 
-            args=(user_id, ip_address, user_agent, session_id, url, analysis_type),
-            daemon=True
+        # Increment user usage
+        usage_result = FirestoreUser.increment_usage(user_id, current_usage=daily_usage, batch=batch)
+        if not usage_result['success']:
+            logger.warning("Failed to increment usage for user %s: %s", user_id, usage_result['error'])
+        
+        try:
+            # Not retried: the batch carries the usage increment, which must not count twice
+            batch.commit()
+        except Exception as e:
+            logger.exception("Failed to create session")
+            # The cached profile was already bumped for the increment that never landed,
+            # and the limiter's unit paid for a session that was never created
+            FirestoreUser.invalidate_cache(user_id)
+            refund_daily_quota(user_id, daily_limit)
+            return jsonify({
+                'success': False,
+                'error': 'Failed to create analysis session'
+            }), 500
+        
+        if created_user and usage_result['success']:
+            # Cached only once the profile exists, counting the usage increment the batch applied
+            FirestoreUser.cache_profile(user_id, {
+                **user_data,
+                'daily_usage': usage_result['daily_usage'],
+                'lifetime_analysis_count': user_data.get('lifetime_analysis_count', 0) + 1,
+                'last_analysis': usage_result['update_time']
+            })
+        
+        # Start enhanced background analysis with real scraping on the bounded worker pool
+        cancel_event = threading.Event()
+        future = analysis_executor.submit(
+            run_real_analysis,
+            user_id, ip_address, user_agent, session_id, url, analysis_type, cancel_event
         )
-        analysis_thread.start()
+        _active_analyses[session_id] = (future, cancel_event)
+        # Runs immediately if the analysis already finished, so the entry never outlives it
+        future.add_done_callback(lambda _: _active_analyses.pop(session_id, None))
+        future.add_done_callback(lambda _: _analysis_slots.release())
+        slot_held = False
         
-        logging.info(f"🚀 REAL SCRAPING analysis session started successfully: {session_id}")
+        logger.info("🚀 REAL SCRAPING analysis session started successfully: %s", session_id)
         
         return jsonify({
             'success': True,
@@ -291,11 +544,14 @@ def start_analysis():
         }), 200
         
     except Exception as e:
-        logging.error(f"🚨 Analysis start error: {str(e)}")
+        logger.exception("🚨 Analysis start error")
         return jsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
         }), 500
+    finally:
+        if slot_held:
+            _analysis_slots.release()
 
 @analysis_bp.route('/status/<session_id>', methods=['GET'])
 @require_auth
@@ -317,52 +573,99 @@ def get_analysis_status(session_id):
         
         # Verify user owns this session
         if session_data.get('user_id') != user_id:
-            logging.warning(f"User {user_id} attempted to access session {session_id} owned by {session_data.get('user_id')}")
+            logger.warning("User %s attempted to access session %s owned by %s", user_id, session_id, session_data.get('user_id'))
             return jsonify({
                 'success': False,
                 'error': 'Access denied'
             }), 403
         
-        # Enhanced status information for real analysis
-        response_data = {
-            'success': True,
-            'session_id': session_id,
-            'status': session_data.get('status', 'unknown'),
-            'progress': session_data.get('progress', 0),
-            'created_at': session_data.get('created_at'),
-            'updated_at': session_data.get('updated_at'),
-            'url': session_data.get('url'),
-            'analysis_type': session_data.get('analysis_type'),
-            'processing_steps': session_data.get('processing_steps', []),
-            'is_real_analysis': True,  # Indicate this is real analysis
-            'features_enabled': [
-                'Web Scraping',
-                'AI Analysis',
-                'Real-time Processing'
-            ]
-        }
+        session_data = fail_if_stalled(session_id, session_data)
+        response_data = build_status_payload(session_id, session_data)
+        
+        # Pollers resend the ETag; unchanged sessions get an empty 304
+        response = jsonify(response_data)
+        response.set_etag(f"{response_data['status']}-{response_data['progress']}-{response_data['updated_at']}")
+        return response.make_conditional(request)
+        
+    except Exception as e:
+        logger.exception("Status check error for session %s", session_id)
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@analysis_bp.route('/stream/<session_id>', methods=['GET'])
+@require_auth
+def stream_analysis_status(session_id):
+    """Push status updates for a session as Server-Sent Events instead of client polling"""
+    try:
+        user_id = request.user_id
+        
+        session_result = AnalysisSession.get_session(session_id)
         
-        # Include error message if failed
-        if session_data.get('status') == 'failed':
-            response_data['error'] = session_data.get('error_message', 'Real analysis failed')
-        
-        # Add completion metadata if available
-        if session_data.get('status') == 'completed':
-            results = session_data.get('results', {})
-            metadata = results.get('analysis_metadata', {})
-            if metadata:
-                response_data['analysis_metadata'] = {
-                    'processing_time': metadata.get('processing_time', 0),
-                    'data_source': metadata.get('data_source', 'live_scraping'),
-                    'platform_detected': metadata.get('platform_detected', 'unknown'),
-                    'confidence_score': metadata.get('confidence_score', 0),
-                    'ai_model': metadata.get('ai_model', 'Gemini Pro')
-                }
-        
-        return jsonify(response_data), 200
+        if not session_result['success']:
+            return jsonify({
+                'success': False,
+                'error': session_result['error']
+            }), 404
+        
+        if session_result['session'].get('user_id') != user_id:
+            logger.warning("User %s attempted to stream session %s owned by %s", user_id, session_id, session_result['session'].get('user_id'))
+            return jsonify({
+                'success': False,
+                'error': 'Access denied'
+            }), 403
+        
+        # Settle an abandoned session first; the listener's initial snapshot then reports it failed
+        fail_if_stalled(session_id, session_result['session'])
+        
+        if not _stream_slots.acquire(blocking=False):
+            logger.warning("Stream limit reached, sending session %s back to polling", session_id)
+            response = jsonify({
+                'success': False,
+                'error': 'Too many live status streams. Poll /status instead.',
+                'status_url': url_for('analysis.get_analysis_status', session_id=session_id)
+            })
+            response.headers['Retry-After'] = str(STREAM_BUSY_RETRY_AFTER)
+            return response, 503
+        
+        # One Firestore listener per stream; snapshots arrive on the listener's thread
+        updates = queue.Queue()
+        try:
+            watch = AnalysisSession.watch_session(session_id, updates.put)
+        except Exception:
+            _stream_slots.release()
+            raise
+        
+        def generate():
+            try:
+                while True:
+                    try:
+                        session_data = updates.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                    except queue.Empty:
+                        yield ': keepalive\n\n'
+                        continue
+                    if session_data is None:
+                        yield 'event: deleted\ndata: {}\n\n'
+                        return
+                    payload = build_status_payload(session_id, session_data)
+                    yield f"data: {current_app.json.dumps(payload)}\n\n"
+                    if payload['status'] in TERMINAL_STATUSES:
+                        return
+            finally:
+                watch.unsubscribe()
+        
+        response = Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        # Runs once the server is done with the response, even if the stream never started
+        response.call_on_close(_stream_slots.release)
+        return response
         
     except Exception as e:
-        logging.error(f"Status check error for session {session_id}: {str(e)}")
+        logger.exception("Status stream error for session %s", session_id)
         return jsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
@@ -375,8 +678,8 @@ def get_analysis_results(session_id):
     try:
         user_id = request.user_id
         
-        # Get session data
-        session_result = AnalysisSession.get_session(session_id)
+        # Get session data, masked to the fields this response shows
+        session_result = AnalysisSession.get_session(session_id, view='results')
         
         if not session_result['success']:
             return jsonify({
@@ -436,10 +739,15 @@ def get_analysis_results(session_id):
             'ai_powered': True
         }
         
-        return jsonify(response_data), 200
+        # Completed results never change, so a client holding this ETag gets an empty 304; no-cache
+        # makes it revalidate every time so a deleted or expired session stops being shown at once
+        response = jsonify(response_data)
+        response.set_etag(f"{session_id}-{session_data.get('completed_at')}")
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
         
     except Exception as e:
-        logging.error(f"Results retrieval error for session {session_id}: {str(e)}")
+        logger.exception("Results retrieval error for session %s", session_id)
         return jsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
@@ -452,18 +760,34 @@ def get_analysis_history():
     try:
         user_id = request.user_id
         limit = request.args.get('limit', 10, type=int)
-        
-        # Validate limit
-        if limit > 50:
-            limit = 50
-        
-        logging.info(f"Getting analysis history for user {user_id}, limit: {limit}")
+        # Session id of the last entry on the previous page
+        start_after = request.args.get('start_after')
+        
+        # Validate limit; Firestore rejects zero and negative limits
+        limit = max(1, min(limit, 50))
+        
+        logger.info("Getting analysis history for user %s, limit: %s, start_after: %s", user_id, limit, start_after)
+        
+        # NDJSON streams one session per line as Firestore delivers it
+        if request.args.get('format') == 'ndjson':
+            def generate():
+                try:
+                    for session in AnalysisSession.iter_user_sessions(user_id, limit, start_after=start_after):
+                        yield current_app.json.dumps(format_history_session(session)) + '\n'
+                except Exception as e:
+                    logger.exception("History stream error")
+                    yield current_app.json.dumps({
+                        'success': False,
+                        'error': 'Failed to retrieve analysis history'
+                    }) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
         
         # Get user sessions
-        sessions_result = AnalysisSession.get_user_sessions(user_id, limit)
+        sessions_result = AnalysisSession.get_user_sessions(user_id, limit, start_after=start_after)
         
         if not sessions_result['success']:
-            logging.error(f"History retrieval error: {sessions_result['error']}")
+            logger.error("History retrieval error: %s", sessions_result['error'])
             return jsonify({
                 'success': False,
                 'error': 'Failed to retrieve analysis history'
@@ -472,43 +796,14 @@ def get_analysis_history():
         sessions = sessions_result['sessions']
         
         # Format sessions for frontend with enhanced information
-        formatted_sessions = []
-        for session in sessions:
-            formatted_session = {
-                'session_id': session.get('session_id'),
-                'url': session.get('url'),
-                'analysis_type': session.get('analysis_type'),
-                'status': session.get('status'),
-                'progress': session.get('progress', 0),
-                'created_at': session.get('created_at'),
-                'completed_at': session.get('completed_at'),
-                'has_results': bool(session.get('results')),
-                'is_real_analysis': True,  # All new analyses use real scraping
-                'features': ['Web Scraping', 'AI Analysis']
-            }
-            
-            # Include error message for failed analyses
-            if session.get('status') == 'failed':
-                formatted_session['error_message'] = session.get('error_message')
-            
-            # Add analysis metadata if available
-            if session.get('results'):
-                results = session.get('results', {})
-                metadata = results.get('analysis_metadata', {})
-                if metadata:
-                    formatted_session['metadata'] = {
-                        'platform_detected': metadata.get('platform_detected', 'unknown'),
-                        'processing_time': metadata.get('processing_time', 0),
-                        'data_source': metadata.get('data_source', 'live_scraping'),
-                        'ai_model': metadata.get('ai_model', 'Gemini Pro')
-                    }
-            
-            formatted_sessions.append(formatted_session)
+        formatted_sessions = [format_history_session(session) for session in sessions]
         
         return jsonify({
             'success': True,
             'sessions': formatted_sessions,
             'total_count': len(formatted_sessions),
+            # A full page may have more behind it; pass this back as start_after
+            'next_cursor': formatted_sessions[-1]['session_id'] if formatted_sessions and len(formatted_sessions) == limit else None,
             'features_enabled': [
                 'Real Web Scraping',
                 'Gemini AI Analysis',
@@ -518,7 +813,7 @@ def get_analysis_history():
         }), 200
         
     except Exception as e:
-        logging.error(f"History retrieval error: {str(e)}")
+        logger.exception("History retrieval error")
         return jsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
@@ -549,6 +844,10 @@ def delete_analysis(session_id):
                 'error': 'Access denied'
             }), 403
         
+        # Don't keep scraping for a session that is about to disappear
+        if cancel_analysis(session_id):
+            logger.info("Cancelled in-flight analysis for deleted session %s", session_id)
+        
         # Delete the session and scraped data
         delete_result = AnalysisSession.delete_session(session_id)
         
@@ -576,7 +875,7 @@ def delete_analysis(session_id):
             ip_address=request.remote_addr
         )
         
-        logging.info(f"Real analysis session and scraped data deleted by user {user_id}: {session_id}")
+        logger.info("Real analysis session and scraped data deleted by user %s: %s", user_id, session_id)
         
         return jsonify({
             'success': True,
@@ -585,7 +884,7 @@ def delete_analysis(session_id):
         }), 200
         
     except Exception as e:
-        logging.error(f"Analysis deletion error for session {session_id}: {str(e)}")
+        logger.exception("Analysis deletion error for session %s", session_id)
         return jsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
@@ -608,12 +907,7 @@ def get_analysis_capabilities():
                 'Public Profiles'
             ],
             'ai_model': 'Google Gemini Pro 1.5',
-            'analysis_types': [
-                'comprehensive',
-                'privacy_only', 
-                'sentiment',
-                'basic'
-            ],
+            'analysis_types': list(ANALYSIS_TYPES),
             'features': [
                 'Real web scraping',
                 'AI-powered content analysis',
@@ -658,6 +952,20 @@ def not_found(error):
         'error': 'Resource not found'
     }), 404
 
+@analysis_bp.errorhandler(413)
+def payload_too_large(error):
+    return jsonify({
+        'success': False,
+        'error': 'Request body too large'
+    }), 413
+
+@analysis_bp.errorhandler(415)
+def unsupported_media_type(error):
+    return jsonify({
+        'success': False,
+        'error': 'Request body must be JSON'
+    }), 415
+
 @analysis_bp.errorhandler(429)
 def rate_limit_exceeded(error):
     return jsonify({
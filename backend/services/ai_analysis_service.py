@@ -5,9 +5,13 @@ from bs4 import BeautifulSoup
 import google.generativeai as genai
 import json
 import time
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional
 import random
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+# Connections kept open to ScrapingBee; matches the default analysis worker pool
+SCRAPE_POOL_SIZE = int(os.getenv('ANALYSIS_WORKERS', 8))
 
 class AIAnalysisService:
     """Enhanced AI Analysis Service with real web scraping using ScrapingBee and Gemini Pro integration"""
@@ -31,6 +35,11 @@ class AIAnalysisService:
         if not self.scrapingbee_api_key:
             self.logger.error("ScrapingBee API key is not set in environment variable SCRAPINGBEE_API_KEY")
 
+        # One pooled session for all ScrapingBee calls so analyses reuse warm keep-alive
+        # connections instead of a new TCP+TLS handshake per scrape
+        self.http = requests.Session()
+        self.http.mount('https://', HTTPAdapter(pool_maxsize=SCRAPE_POOL_SIZE))
+
         # Headers for GA requests (still useful for Gemini calls)
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
@@ -50,27 +59,36 @@ class AIAnalysisService:
             "render_js": "true"  # enable JS rendering for dynamic pages
         }
         try:
-            response = requests.get(api_endpoint, params=params, timeout=30)
+            response = self.http.get(api_endpoint, params=params, timeout=30)
             response.raise_for_status()
             return response.text
         except Exception as e:
             self.logger.error(f"ScrapingBee request failed for {url}: {str(e)}")
             raise
 
-    def analyze_profile(self, url: str, analysis_type: str) -> Dict[str, Any]:
+    def analyze_profile(self, url: str, analysis_type: str,
+                        progress_cb: Optional[Callable[[int, str], None]] = None) -> Dict[str, Any]:
         """
-        Main analysis method that scrapes real data using ScrapingBee and uses Gemini for insights
+        Main analysis method that scrapes real data using ScrapingBee and uses Gemini for insights.
+        progress_cb(progress, description) is called as each real phase starts.
         """
+        def report(progress: int, description: str) -> None:
+            if progress_cb:
+                progress_cb(progress, description)
+
         try:
             self.logger.info(f"Starting real analysis for URL: {url}, Type: {analysis_type}")
 
+            report(10, '🔍 Validating URL and detecting platform')
             platform = self._detect_platform(url)
+            report(25, '📊 Scraping public profile data')
             scraped_data = self._scrape_profile_data(url, platform)
 
             if not scraped_data:
                 self.logger.warning(f"No data scraped from {url}, using fallback analysis")
                 return self._fallback_analysis(url, analysis_type)
 
+            report(50, '🤖 Processing scraped data with Gemini AI')
             analysis_results = self._analyze_with_gemini(scraped_data, analysis_type, platform)
             self.logger.info(f"Real analysis completed successfully for URL: {url}")
             return {'success': True, 'results': analysis_results}
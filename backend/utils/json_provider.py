@@ -0,0 +1,49 @@
+import logging
+from datetime import datetime
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes with orjson, so jsonify() stays the API for routes"""
+
+    if ORJSON_AVAILABLE:
+        options = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    @staticmethod
+    def _default(o: Any) -> Any:
+        # Firestore timestamps are datetime subclasses, which orjson hands back to us
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+    def _encode(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=self._default, option=self.options)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # Formatting options like indent or sort_keys still go through the stdlib encoder
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode()
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._encode(obj), mimetype=self.mimetype)
+
+
+def install_json_provider(app) -> None:
+    """Switch the app to orjson serialization when orjson is installed"""
+    if ORJSON_AVAILABLE:
+        app.json = OrjsonProvider(app)
+    else:
+        logger.warning("orjson not available, using the standard JSON provider")
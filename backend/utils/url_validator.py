@@ -1,10 +1,55 @@
 import re
 import logging
 from urllib.parse import urlparse
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Known social domains and the platform each one belongs to
+DOMAIN_TO_PLATFORM = {
+    'linkedin.com': 'linkedin',
+    'instagram.com': 'instagram',
+    'twitter.com': 'twitter',
+    'x.com': 'twitter',
+    'facebook.com': 'facebook',
+    'github.com': 'github',
+    'youtube.com': 'youtube',
+    'tiktok.com': 'tiktok',
+    'reddit.com': 'reddit',
+    'pinterest.com': 'pinterest',
+    'snapchat.com': 'snapchat'
+}
+
+# Example profile URLs offered when a URL doesn't match its platform's patterns
+EXAMPLE_FORMATS = {
+    'linkedin': (
+        'https://linkedin.com/in/username',
+        'https://www.linkedin.com/in/username'
+    ),
+    'instagram': (
+        'https://instagram.com/username',
+        'https://www.instagram.com/username'
+    ),
+    'twitter': (
+        'https://twitter.com/username',
+        'https://x.com/username'
+    ),
+    'facebook': (
+        'https://facebook.com/username',
+        'https://www.facebook.com/username'
+    ),
+    'github': (
+        'https://github.com/username',
+    ),
+    'youtube': (
+        'https://youtube.com/@username',
+        'https://www.youtube.com/c/username'
+    ),
+    'tiktok': (
+        'https://tiktok.com/@username',
+    )
+}
+
 
 class SocialMediaURLValidator:
     """Comprehensive social media URL validation"""
@@ -59,6 +104,15 @@ class SocialMediaURLValidator:
             'medium.com', 'behance.net', 'dribbble.com', 'vimeo.com'
         }
 
+        # Listed in domain-rejection errors; built once rather than per failed validation
+        self.supported_platforms = tuple(self.platform_patterns)
+
+        # Compiled once; a URL is only matched against the patterns of its own platform
+        self._compiled_patterns = {
+            platform: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+            for platform, patterns in self.platform_patterns.items()
+        }
+
     def validate_social_url(self, url: str) -> Dict[str, any]:
         """
         Validate social media URL and return detailed analysis
@@ -91,11 +145,11 @@ class SocialMediaURLValidator:
                 'error': f'URL must be from a supported social media platform. Domain "{domain}" is not supported.',
                 'platform': None,
                 'username': None,
-                'supported_platforms': list(self.platform_patterns.keys())
+                'supported_platforms': self.supported_platforms
             }
 
         # Validate against platform patterns
-        platform, is_valid = self._validate_platform_pattern(clean_url)
+        platform, is_valid = self._validate_platform_pattern(clean_url, domain)
 
         if not is_valid:
             return {
@@ -103,7 +157,7 @@ class SocialMediaURLValidator:
                 'error': f'Invalid URL format for {platform or "social media"} platform. Please check the URL structure.',
                 'platform': platform,
                 'username': None,
-                'example_formats': self._get_example_formats(platform) if platform else []
+                'example_formats': self._get_example_formats(platform) if platform else ()
             }
 
         # Extract username if possible
@@ -166,15 +220,18 @@ class SocialMediaURLValidator:
         """Check if domain is a social media platform"""
         return domain in self.social_domains
 
-    def _validate_platform_pattern(self, url: str) -> Tuple[Optional[str], bool]:
+    def _validate_platform_pattern(self, url: str, domain: Optional[str] = None) -> Tuple[Optional[str], bool]:
         """Validate URL against platform-specific patterns"""
-        for platform, patterns in self.platform_patterns.items():
-            for pattern in patterns:
-                if re.match(pattern, url, re.IGNORECASE):
-                    return platform, True
+        if domain is None:
+            domain = self._extract_domain(url)
+
+        # Every pattern is anchored to its platform's domain, so only that platform can match
+        platform = DOMAIN_TO_PLATFORM.get(domain)
+        for pattern in self._compiled_patterns.get(platform, ()):
+            if pattern.match(url):
+                return platform, True
 
         # Check if it's a recognized social domain but doesn't match patterns
-        domain = self._extract_domain(url)
         if self._is_social_media_domain(domain):
             # Try to infer platform from domain
             platform = self._infer_platform_from_domain(domain)
@@ -184,20 +241,7 @@ class SocialMediaURLValidator:
 
     def _infer_platform_from_domain(self, domain: str) -> str:
         """Infer platform name from domain"""
-        domain_to_platform = {
-            'linkedin.com': 'linkedin',
-            'instagram.com': 'instagram',
-            'twitter.com': 'twitter',
-            'x.com': 'twitter',
-            'facebook.com': 'facebook',
-            'github.com': 'github',
-            'youtube.com': 'youtube',
-            'tiktok.com': 'tiktok',
-            'reddit.com': 'reddit',
-            'pinterest.com': 'pinterest',
-            'snapchat.com': 'snapchat'
-        }
-        return domain_to_platform.get(domain, 'unknown')
+        return DOMAIN_TO_PLATFORM.get(domain, 'unknown')
 
     def _extract_username(self, url: str, platform: str) -> Optional[str]:
         """Extract username from social media URL"""
@@ -251,37 +295,9 @@ class SocialMediaURLValidator:
         except:
             return None
 
-    def _get_example_formats(self, platform: str) -> List[str]:
+    def _get_example_formats(self, platform: str) -> Tuple[str, ...]:
         """Get example URL formats for a platform"""
-        examples = {
-            'linkedin': [
-                'https://linkedin.com/in/username',
-                'https://www.linkedin.com/in/username'
-            ],
-            'instagram': [
-                'https://instagram.com/username',
-                'https://www.instagram.com/username'
-            ],
-            'twitter': [
-                'https://twitter.com/username',
-                'https://x.com/username'
-            ],
-            'facebook': [
-                'https://facebook.com/username',
-                'https://www.facebook.com/username'
-            ],
-            'github': [
-                'https://github.com/username'
-            ],
-            'youtube': [
-                'https://youtube.com/@username',
-                'https://www.youtube.com/c/username'
-            ],
-            'tiktok': [
-                'https://tiktok.com/@username'
-            ]
-        }
-        return examples.get(platform, [])
+        return EXAMPLE_FORMATS.get(platform, ())
 
 
 def create_url_validator():